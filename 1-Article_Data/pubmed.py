@@ -1,8 +1,12 @@
-import requests
 from lxml import etree  # Replaced xml.etree.ElementTree with lxml
 from bs4 import BeautifulSoup
 import csv
 import os
+import sys
+
+# Make the shared instrumentation module in the repository root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import instrumentation
 
 # Base URL for NCBI E-utilities
 base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
@@ -14,11 +18,215 @@ def clean_html(raw_html):
     soup = BeautifulSoup(raw_html, "html.parser")
     return soup.get_text()
 
+# Column order of the output CSV
+FIELDNAMES = ["PMID", "Title", "Authors", "Abstract", "DOI",
+              "Journal", "PublicationDate", "Volume", "Issue",
+              "Pages", "PublicationType", "Keywords", "PMC_ID", "MeSH_Terms",
+              "GrantInfo", "Language", "ISSN"]
+
+# Text written to the CSV for missing values (records themselves store None instead)
+MISSING_VALUES = {
+    "PMID": "No PMID available",
+    "Title": "No title available",
+    "Abstract": "No abstract available",
+    "DOI": "No DOI",
+    "Journal": "No journal available",
+    "PublicationDate": "No publication date available",
+    "Volume": "No volume available",
+    "Issue": "No issue available",
+    "Pages": "No pages available",
+    "Keywords": "No keywords available",
+    "PMC_ID": "No PMC ID",
+    "MeSH_Terms": "No MeSH terms",
+    "GrantInfo": "No grant information",
+    "Language": "No language information",
+    "ISSN": "No ISSN available",
+}
+
+class ArticleRecord:
+    """
+    Compact representation of one parsed PubMed article.
+
+    With 100k+ articles, one 17-key dict per article (full of repeated "No ... available"
+    strings) dominates memory. Records use __slots__ instead, store missing values as None
+    and the PMID as an integer, keep authors, publication types, keywords, MeSH terms and
+    grants as tuples, and intern the values shared by many articles (journal, language, MeSH
+    terms, ...). They are only turned into CSV text (with the "No ... available" placeholders)
+    by "to_row".
+    """
+    __slots__ = ("pmid", "title", "authors", "abstract", "doi", "journal", "publication_date",
+                 "volume", "issue", "pages", "publication_types", "keywords", "pmc_id",
+                 "mesh_terms", "grants", "language", "issn")
+
+    def __init__(self, pmid=None, title=None, authors=(), abstract=None, doi=None, journal=None,
+                 publication_date=None, volume=None, issue=None, pages=None, publication_types=(),
+                 keywords=(), pmc_id=None, mesh_terms=(), grants=(), language=None, issn=None):
+        self.pmid = pmid
+        self.title = title
+        self.authors = authors
+        self.abstract = abstract
+        self.doi = doi
+        self.journal = journal
+        self.publication_date = publication_date
+        self.volume = volume
+        self.issue = issue
+        self.pages = pages
+        self.publication_types = publication_types
+        self.keywords = keywords
+        self.pmc_id = pmc_id
+        self.mesh_terms = mesh_terms
+        self.grants = grants
+        self.language = language
+        self.issn = issn
+
+    def to_row(self):
+        """
+        Returns the CSV row (in FIELDNAMES order), filling in the text for missing values.
+        """
+        def text(value, field):
+            return MISSING_VALUES[field] if value is None else value
+
+        def joined(values, field=None):
+            if values:
+                return ", ".join(values)
+            return MISSING_VALUES[field] if field else ""
+
+        return (
+            text(self.pmid if self.pmid is None else str(self.pmid), "PMID"),
+            text(self.title, "Title"),
+            joined(self.authors),
+            text(self.abstract, "Abstract"),
+            text(self.doi, "DOI"),
+            text(self.journal, "Journal"),
+            text(self.publication_date, "PublicationDate"),
+            text(self.volume, "Volume"),
+            text(self.issue, "Issue"),
+            text(self.pages, "Pages"),
+            joined(self.publication_types),
+            joined(self.keywords, "Keywords"),
+            text(self.pmc_id, "PMC_ID"),
+            joined(self.mesh_terms, "MeSH_Terms"),
+            joined(self.grants, "GrantInfo"),
+            text(self.language, "Language"),
+            text(self.issn, "ISSN"),
+        )
+
+    def to_dict(self):
+        return dict(zip(FIELDNAMES, self.to_row()))
+
+# Publication type combinations are shared by many articles, so each distinct one is stored once
+_publication_type_tuples = {}
+
+def _element_text(element, shared=False):
+    """
+    Returns the text of an element ('' if it has none) or None if the element is missing.
+    Values repeated across many articles are interned so they are stored only once.
+    """
+    if element is None:
+        return None
+    if element.text is None:
+        return ""
+    return sys.intern(element.text) if shared else element.text
+
+def parse_article(article):
+    """
+    Parses one PubmedArticle element into an ArticleRecord.
+    """
+    title = None
+    title_element = article.find(".//ArticleTitle")
+    if title_element is not None:
+        title_xml = etree.tostring(title_element, encoding="unicode", method="xml")
+        title = clean_html(title_xml).rstrip('.')  # Remove trailing period
+
+    # Fetching full abstract information
+    abstract = None
+    abstract_element = article.find(".//AbstractText")
+    if abstract_element is not None:
+        abstract_xml = etree.tostring(abstract_element, encoding="unicode", method="xml")
+        abstract = clean_html(abstract_xml)
+
+    authors = []
+    for author in article.findall(".//Author"):
+        firstname = author.find("ForeName").text if author.find("ForeName") is not None else ""
+        lastname = author.find("LastName").text if author.find("LastName") is not None else ""
+        if firstname and lastname:
+            authors.append(f"{firstname} {lastname}")
+
+    # Updated DOI fetching mechanism
+    doi = None
+    for eid in article.findall(".//ELocationID[@EIdType='doi']"):
+        doi = eid.text
+        break
+    if not doi:  # Fallback mechanism
+        for article_id in article.findall(".//ArticleId[@IdType='doi']"):
+            doi = article_id.text
+            break
+    doi = doi or None  # Empty DOIs count as missing
+
+    # Locate the PubDate element in the JournalIssue section.
+    pubdate_element = article.find(".//Journal/JournalIssue/PubDate")
+    publication_date = None
+    if pubdate_element is not None:
+        # First, try to get the Year, Month, and Day if available.
+        year = pubdate_element.find("Year")
+        month = pubdate_element.find("Month")
+        day = pubdate_element.find("Day")
+
+        if year is not None:
+            # Build the publication date string
+            publication_date = year.text
+            if month is not None:
+                publication_date += "-" + month.text
+            if day is not None:
+                publication_date += "-" + day.text
+            publication_date = sys.intern(publication_date)
+        else:
+            # Some records provide a MedlineDate instead of individual elements.
+            medline_date = pubdate_element.find("MedlineDate")
+            if medline_date is not None:
+                publication_date = medline_date.text
+
+    # PMIDs are numeric, so store them as integers (converted back to text in "to_row")
+    pmid = _element_text(article.find(".//PMID"))
+    if pmid and pmid.isdigit():
+        pmid = int(pmid)
+
+    publication_types = tuple(sys.intern(pt.text) for pt in article.findall(".//PublicationType") if pt.text is not None)
+    publication_types = _publication_type_tuples.setdefault(publication_types, publication_types)
+
+    return ArticleRecord(
+        pmid=pmid,
+        title=title,
+        authors=tuple(authors),
+        abstract=abstract,
+        doi=doi,
+        journal=_element_text(article.find(".//Title"), shared=True),
+        publication_date=publication_date,
+        volume=_element_text(article.find(".//Volume"), shared=True),
+        issue=_element_text(article.find(".//Issue"), shared=True),
+        pages=_element_text(article.find(".//MedlinePgn")),
+        publication_types=publication_types,
+        keywords=tuple(sys.intern(keyword.text) for keyword in article.findall(".//Keyword") if keyword.text is not None),
+        pmc_id=_element_text(article.find(".//ArticleId[@IdType='pmc']")),
+        mesh_terms=tuple(sys.intern(mesh.text) for mesh in article.findall(".//MeshHeadingList/MeshHeading/DescriptorName") if mesh.text is not None),
+        grants=tuple(grant.text for grant in article.findall(".//GrantList/Grant/GrantID") if grant.text is not None),
+        language=_element_text(article.find(".//Language"), shared=True),
+        issn=_element_text(article.find(".//ISSN"), shared=True),
+    )
+
 def fetch_all_pubmed_data(query, start_date=None, end_date=None):
     """
     Fetches all PubMed data for a given search query, handling HTML tags properly.
     Allows optional filtering by publication year range.
+    Raises RuntimeError if any request fails or returns unreadable XML, instead of
+    returning a partial result.
     """
+    with instrumentation.stage("pubmed"):
+        results = _fetch_all_pubmed_data(query, start_date, end_date)
+        instrumentation.record_rows("pubmed", rows_out=len(results))
+    return results
+
+def _fetch_all_pubmed_data(query, start_date, end_date):
     # Construct the query with optional data filters
     if start_date and end_date:
         query += f' AND ({start_date}[PDAT] : {end_date}[PDAT])'
@@ -41,19 +249,20 @@ def fetch_all_pubmed_data(query, start_date=None, end_date=None):
             "retmode": "xml",
             "sort": "relevance",  # Ensures "Best Match" sorting
         }
-        esearch_response = requests.get(esearch_url, params=esearch_params)
+        esearch_response = instrumentation.http_get("pubmed", esearch_url, params=esearch_params)
 
+        # Stop the whole fetch on errors: an incomplete result must not be saved as if it were complete
         if esearch_response.status_code != 200:
             print(f"Error: {esearch_response.status_code}")
             print(esearch_response.text)
-            break
+            raise RuntimeError(f"PubMed search failed with HTTP {esearch_response.status_code} after {len(all_pmids)} PMIDs")
 
         try:
             # Parse using lxml
             esearch_tree = etree.fromstring(esearch_response.content)
         except etree.XMLSyntaxError as e:
             print(f"XML Parse Error: {e}")
-            break
+            raise RuntimeError(f"Could not parse PubMed search results after {len(all_pmids)} PMIDs") from e
 
         pmids = [id_elem.text for id_elem in esearch_tree.findall(".//Id")]
 
@@ -77,12 +286,12 @@ def fetch_all_pubmed_data(query, start_date=None, end_date=None):
             "id": ",".join(batch_pmids),
             "retmode": "xml",
         }
-        efetch_response = requests.get(efetch_url, params=efetch_params)
+        efetch_response = instrumentation.http_get("pubmed", efetch_url, params=efetch_params)
 
         if efetch_response.status_code != 200:
             print(f"Error: {efetch_response.status_code}")
             print(efetch_response.text)
-            break
+            raise RuntimeError(f"PubMed fetch failed with HTTP {efetch_response.status_code} after {len(results)} articles")
 
         try:
             # Explicitly decode the response content as UTF-8
@@ -91,126 +300,20 @@ def fetch_all_pubmed_data(query, start_date=None, end_date=None):
             efetch_tree = etree.fromstring(response_content.encode('utf-8'))
         except etree.XMLSyntaxError as e:
             print(f"XML Parse Error: {e}")
-            break
+            raise RuntimeError(f"Could not parse PubMed article details after {len(results)} articles") from e
 
         for article in efetch_tree.findall(".//PubmedArticle"):
-            pmid_element = article.find(".//PMID")
-            pmid = pmid_element.text if pmid_element is not None else "No PMID available"
-
-            title_element = article.find(".//ArticleTitle")
-            title = title_element.text if title_element is not None else "No title available"
-
-            if title_element is not None:
-                title_xml = etree.tostring(title_element, encoding="unicode", method="xml")
-                title = clean_html(title_xml).encode('utf-8').decode('utf-8').rstrip('.')  # Remove trailing period
-
-            # Fetching full abstract information
-            abstract_element = article.find(".//AbstractText")
-            abstract = "No abstract available"
-            if abstract_element is not None:
-                abstract_xml = etree.tostring(abstract_element, encoding="unicode", method="xml")
-                abstract = clean_html(abstract_xml).encode('utf-8').decode('utf-8')
-
-            authors = []
-            for author in article.findall(".//Author"):
-                firstname = author.find("ForeName").text if author.find("ForeName") is not None else ""
-                lastname = author.find("LastName").text if author.find("LastName") is not None else ""
-                if firstname and lastname:
-                    authors.append(f"{firstname} {lastname}")
-
-            # Updated DOI fetching mechanism
-            doi = None
-            for eid in article.findall(".//ELocationID[@EIdType='doi']"):
-                doi = eid.text
-                break
-            if not doi:  # Fallback mechanism
-                for article_id in article.findall(".//ArticleId[@IdType='doi']"):
-                    doi = article_id.text
-                    break
-            doi = doi if doi else "No DOI"
-
-            journal_element = article.find(".//Title")
-            journal = journal_element.text if journal_element is not None else "No journal available"
-
-            # Locate the PubDate element in the JournalIssue section.
-            pubdate_element = article.find(".//Journal/JournalIssue/PubDate")
-            publication_date = "No publication date available"
-            if pubdate_element is not None:
-                # First, try to get the Year, Month, and Day if available.
-                year = pubdate_element.find("Year")
-                month = pubdate_element.find("Month")
-                day = pubdate_element.find("Day")
-
-                if year is not None:
-                    # Build the publication date string
-                    publication_date = year.text
-                    if month is not None:
-                        publication_date += "-" + month.text
-                    if day is not None:
-                        publication_date += "-" + day.text
-                else:
-                    # Some records provide a MedlineDate instead of individual elements.
-                    medline_date = pubdate_element.find("MedlineDate")
-                    if medline_date is not None:
-                        publication_date = medline_date.text
-
-            volume_element = article.find(".//Volume")
-            volume = volume_element.text if volume_element is not None else "No volume available"
-
-            issue_element = article.find(".//Issue")
-            issue = issue_element.text if issue_element is not None else "No issue available"
-
-            pages_element = article.find(".//MedlinePgn")
-            pages = pages_element.text if pages_element is not None else "No pages available"
-
-            publication_type_elements = article.findall(".//PublicationType")
-            publication_types = ", ".join(pt.text for pt in publication_type_elements if pt.text is not None)
-
-            keywords = []
-            for keyword in article.findall(".//Keyword"):
-                if keyword.text is not None:
-                    keywords.append(keyword.text)
-
-            pmc = article.find(".//ArticleId[@IdType='pmc']")
-            pmc_id = pmc.text if pmc is not None else "No PMC ID"
-
-            mesh_terms = [mesh.text for mesh in article.findall(".//MeshHeadingList/MeshHeading/DescriptorName")]
-            mesh = ", ".join(mesh_terms) if mesh_terms else "No MeSH terms"
-
-            grant_info = ", ".join([grant.text for grant in article.findall(".//GrantList/Grant/GrantID")]) or "No grant information"
-            language = article.find(".//Language").text if article.find(".//Language") is not None else "No language information"
-            issn = article.find(".//ISSN").text if article.find(".//ISSN") is not None else "No ISSN available"
-
-            results.append({
-                "PMID": pmid,
-                "Title": title,
-                "Authors": ", ".join(authors),
-                "Abstract": abstract,
-                "DOI": doi,
-                "Journal": journal,
-                "PublicationDate": publication_date,
-                "Volume": volume,
-                "Issue": issue,
-                "Pages": pages,
-                "PublicationType": publication_types,
-                "Keywords": ", ".join(keywords) if keywords else "No keywords available",
-                "PMC_ID": pmc_id,
-                "MeSH_Terms": mesh,
-                "GrantInfo": grant_info,
-                "Language": language,
-                "ISSN": issn,
-            })
+            results.append(parse_article(article))
 
         print(f"Fetched details for {i + len(batch_pmids)} articles...")
 
     return results
 
-def save_to_csv(data, filename):
+def save_to_csv(data, filename, output_dir="Data"):
     """
-    Saves parsed article data to a CSV file in the 'Data' folder.
+    Saves parsed article records to a CSV file in the 'Data' folder (or the given output_dir).
     If the folder does not exist, it will be created.
     """
-    output_dir = "Data"
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
@@ -218,12 +321,9 @@ def save_to_csv(data, filename):
     file_path = os.path.join(output_dir, filename)
 
     with open(file_path, mode="w", encoding="utf-8-sig", newline="") as file:
-        writer = csv.DictWriter(file, fieldnames=["PMID", "Title", "Authors", "Abstract", "DOI",
-                                                  "Journal", "PublicationDate", "Volume", "Issue",
-                                                  "Pages", "PublicationType", "Keywords", "PMC_ID", "MeSH_Terms",
-                                                  "GrantInfo", "Language", "ISSN"])
-        writer.writeheader()
-        writer.writerows(data)
+        writer = csv.writer(file)
+        writer.writerow(FIELDNAMES)
+        writer.writerows(record.to_row() for record in data)
 
 def main():
     """
@@ -246,9 +346,15 @@ def main():
         end_date = input("Enter end date (YYYY/MM/DD): ").strip()
 
 
-    articles = fetch_all_pubmed_data(query, start_date, end_date)
+    try:
+        articles = fetch_all_pubmed_data(query, start_date, end_date)
+    except RuntimeError as error:
+        print(f"Error: {error}. pubmed.csv was not updated.")
+        instrumentation.write_report("pubmed_run_report.json")
+        return
     save_to_csv(articles, "pubmed.csv")
     print("Data saved to pubmed.csv.")
+    instrumentation.write_report("pubmed_run_report.json")
 
 if __name__ == "__main__":
     main()
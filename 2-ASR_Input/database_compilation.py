@@ -2,14 +2,23 @@ import pandas as pd
 import string
 import os
 import glob
+import sys
+
+# Make the shared instrumentation module in the repository root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import instrumentation
 
 # Set working directory
 
 """
 Set working directory to the main folder containing the sub-folders (Article_Data, ASR_Input, ASR_Output etc.)
+By default this is the repository root, ie. the parent folder of this script.
 
 """
-working_directory = "/mnt/d/Lab Rotation/Litterature_S_automation-main_Marcus/Litterature_S_automation-main/gpt_trial/Organized_Folder"
+working_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Output directory (inside '2-ASR_Input') for the results of the compilation
+output_dir = "Compilation_Outputs"
 
 # Function to load data files
 def load_data():
@@ -188,8 +197,13 @@ def stats(pubmed_df_new, wos_df_new, greenfile_df_new, embase_df_new, compiled_d
                 f.write(f"Number of replicates in Authors for articles with 'No DOI': {replicate_stats['sum_x_authors']}\n")
                 f.write(f"Number of replicates in Journals for articles with 'No DOI': {replicate_stats['sum_x_journals']}\n")
 
-# Main script
-if __name__ == "__main__":
+# Function to run the full compilation (load, compile, deduplicate and write stats)
+def compile_databases():
+
+    # Create an output directory for the results of the compilation
+    output_path = os.path.join(working_directory, '2-ASR_Input', output_dir)
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
 
     """
     Code Explanation: 
@@ -200,13 +214,16 @@ if __name__ == "__main__":
     WoS (2 parts), GreenFile, and Embase
 
     """
+    with instrumentation.stage("compilation"):
+        pubmed_df, wos_df, greenfile_df, embase_df = load_data()
+        pubmed_df_new, wos_df_new, greenfile_df_new, embase_df_new, compiled_df = compile_database_information(pubmed_df, wos_df, greenfile_df, embase_df)
+        replicate_stats = process_replicates_and_dois(compiled_df)
+        stats(pubmed_df_new, wos_df_new, greenfile_df_new, embase_df_new, compiled_df, replicate_stats)
+        instrumentation.record_rows("compilation", rows_in=len(compiled_df), rows_out=replicate_stats['total_unique_dois'])
 
-    # Create an output directory for the results of the compilation 
-    output_dir = "Compilation_Outputs"
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    return replicate_stats
 
-    pubmed_df, wos_df, greenfile_df, embase_df = load_data()
-    pubmed_df_new, wos_df_new, greenfile_df_new, embase_df_new, compiled_df = compile_database_information(pubmed_df, wos_df, greenfile_df, embase_df)
-    replicate_stats = process_replicates_and_dois(compiled_df)
-    stats(pubmed_df_new, wos_df_new, greenfile_df_new, embase_df_new, compiled_df, replicate_stats)
+# Main script
+if __name__ == "__main__":
+    compile_databases()
+    instrumentation.write_report(os.path.join(working_directory + '/2-ASR_Input/' + output_dir + '/compilation_run_report.json'))
@@ -1,11 +1,19 @@
 import os
 import pandas as pd
 import requests
+import sys
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from random import randint
 from time import sleep
 
+# Make the shared instrumentation module in the repository root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import instrumentation
+
+# Base URL for the CrossRef works API
+crossref_url = "https://api.crossref.org/works/"
+
 # Set to track successfully and unsuccessfully processed DOIs
 success_set = set()
 failure_set = set()
@@ -24,11 +32,11 @@ def clear_output_folder(folder_path):
 
 # Function to fetch BibTeX entries from CrossRef API
 def fetch_bibtex(doi, max_retries=3, timeout=15):
-    api_url = f"https://api.crossref.org/works/{doi}/transform/application/x-bibtex"
+    api_url = f"{crossref_url}{doi}/transform/application/x-bibtex"
     
     for attempt in range(max_retries):
         try:
-            response = requests.get(api_url, timeout=timeout)
+            response = instrumentation.http_get("bibtex", api_url, timeout=timeout)
             if response.status_code == 200:
                 print(f"Successfully fetched BibTeX for DOI {doi}")
                 return doi, response.text
@@ -38,6 +46,8 @@ def fetch_bibtex(doi, max_retries=3, timeout=15):
                 return doi, None
         except requests.exceptions.Timeout:
             print(f"Timeout while fetching DOI {doi}, attempt {attempt + 1}/{max_retries}")
+            if attempt + 1 < max_retries:
+                instrumentation.record_retry("bibtex")
         except Exception as error:
             print(f"Error fetching DOI {doi}: {error}")
             failure_set.add(doi)
@@ -88,9 +98,7 @@ def save_successful_entries(input_csv_path, success_csv_path):
     print(f"Saved successful entries to {success_csv_path}")
 
 # Function to write the summary to a text file
-def save_summary_to_txt(output_folder, total_input_count, total_success, total_failures):
-    #summary_file_path = os.path.join(output_folder, 'bibtex_stats.txt')
-    summary_file_path = 'bibtex_stats.txt'
+def save_summary_to_txt(output_folder, total_input_count, total_success, total_failures, summary_file_path='bibtex_stats.txt'):
     with open(summary_file_path, 'w') as summary_file:
         summary_file.write("\nSummary of Results:\n")
         summary_file.write(f"\nTotal input DOIs: {total_input_count}\n")
@@ -100,7 +108,11 @@ def save_summary_to_txt(output_folder, total_input_count, total_success, total_f
     print(f"Summary saved to {summary_file_path}")
 
 # Main function to orchestrate the script
-def process_bibtex_entries(input_csv, output_folder, failed_csv, success_csv):
+def process_bibtex_entries(input_csv, output_folder, failed_csv, success_csv, summary_txt='bibtex_stats.txt'):
+    with instrumentation.stage("bibtex"):
+        _process_bibtex_entries(input_csv, output_folder, failed_csv, success_csv, summary_txt)
+
+def _process_bibtex_entries(input_csv, output_folder, failed_csv, success_csv, summary_txt):
     # Clear or create the output folder
     clear_output_folder(output_folder)
 
@@ -132,6 +144,7 @@ def process_bibtex_entries(input_csv, output_folder, failed_csv, success_csv):
     total_input_count = len(dois)
     total_success = len(success_set)
     total_failures = len(failure_set)
+    instrumentation.record_rows("bibtex", rows_in=total_input_count, rows_out=total_success)
     
     print("\nSummary of Results:")
     print(f"Total input DOIs: {total_input_count}")
@@ -139,7 +152,7 @@ def process_bibtex_entries(input_csv, output_folder, failed_csv, success_csv):
     print(f"Failed to fetch: {total_failures}")
     print(f"Files saved in folder: {len(os.listdir(output_folder))}")
 
-    save_summary_to_txt(output_folder, total_input_count, total_success, total_failures)
+    save_summary_to_txt(output_folder, total_input_count, total_success, total_failures, summary_txt)
 
     if total_success + total_failures != total_input_count:
         print("Warning: Discrepancy in total processed DOIs.")
@@ -147,13 +160,16 @@ def process_bibtex_entries(input_csv, output_folder, failed_csv, success_csv):
         print("All DOIs processed correctly.")
 
 # Input and output paths
-def main():
-    input_csv_path = "unique_articles.csv"  # Path to the input CSV
-    output_folder_path = "bibtex_files"  # Folder to save BibTeX files
-    failed_csv_path = "failed_entries.csv"  # CSV for failed DOIs
-    success_csv_path = "saved_entries.csv"  # CSV for successful DOIs
+script_directory = os.path.dirname(os.path.abspath(__file__))
+input_csv_path = os.path.join(os.path.dirname(script_directory), "2-ASR_Input", "Compilation_Outputs", "unique_articles.csv")  # Path to the input CSV
+output_folder_path = os.path.join(script_directory, "bibtex_files")  # Folder to save BibTeX files
+failed_csv_path = os.path.join(script_directory, "failed_entries.csv")  # CSV for failed DOIs
+success_csv_path = os.path.join(script_directory, "saved_entries.csv")  # CSV for successful DOIs
+summary_txt_path = os.path.join(script_directory, "bibtex_stats.txt")  # Summary of the run
 
-    process_bibtex_entries(input_csv_path, output_folder_path, failed_csv_path, success_csv_path)
+def main():
+    process_bibtex_entries(input_csv_path, output_folder_path, failed_csv_path, success_csv_path, summary_txt_path)
+    instrumentation.write_report(os.path.join(script_directory, "bibtex_run_report.json"))
 
 if __name__ == "__main__":
     main()
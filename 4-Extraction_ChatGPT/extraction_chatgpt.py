@@ -1,30 +1,81 @@
 import pandas as pd
-from openai import OpenAI
+from openai import APIConnectionError, APIStatusError, OpenAI
 import json
 import os
+import sys
+import time
 
-# Initialize OpenAI client
-client = OpenAI(api_key="###")  # <-- Replace with your API key or use environment variable
+# Make the shared instrumentation module in the repository root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import instrumentation
 
-# Step 1: Read CSV file
-df = pd.read_csv("###")  # <-- replace with your file path
+# HTTP status codes worth retrying (rate limits and temporary server errors)
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
 
-# Ensure required columns exist
-if not {"Title", "Abstract"}.issubset(df.columns):
-    raise ValueError("CSV must contain 'Title' and 'Abstract' columns")
-
-results = []
-
-# Step 2: Loop through each record
-for _, row in df.head(100).iterrows():
-
-    title = str(row["Title"])
-    abstract = str(row["Abstract"])
+# Function to send one prompt to ChatGPT, retrying rate limits and temporary errors
+def query_chatgpt(client, prompt, max_retries=3):
+    """
+    Retries are done here rather than inside the OpenAI client (which must be created with
+    max_retries=0), so that every attempt, its status and size end up in the run report.
+    """
+    for attempt in range(max_retries + 1):
+        start_time = time.perf_counter()
+        try:
+            raw_response = client.chat.completions.with_raw_response.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": "You are a scientific text analysis assistant."},
+                    {"role": "user", "content": prompt}
+                ]
+            )
+        except APIStatusError as error:
+            instrumentation.record_request("extraction", time.perf_counter() - start_time, status=error.status_code,
+                                           bytes_received=len(error.response.content),
+                                           bytes_sent=len(error.response.request.content), failed=True)
+            if error.status_code not in RETRY_STATUS_CODES or attempt == max_retries:
+                raise
+            print(f"HTTP Error {error.status_code} from ChatGPT, attempt {attempt + 1}/{max_retries + 1}")
+        except APIConnectionError as error:
+            instrumentation.record_request("extraction", time.perf_counter() - start_time, status=type(error).__name__,
+                                           bytes_sent=len(error.request.content), failed=True)
+            if attempt == max_retries:
+                raise
+            print(f"Connection error from ChatGPT ({error}), attempt {attempt + 1}/{max_retries + 1}")
+        else:
+            http_response = raw_response.http_response
+            instrumentation.record_request("extraction", time.perf_counter() - start_time, status=http_response.status_code,
+                                           bytes_received=len(http_response.content),
+                                           bytes_sent=len(http_response.request.content))
+            response = raw_response.parse()
+            instrumentation.record_tokens("extraction", response.usage)
+            return response
+
+        instrumentation.record_retry("extraction")
+        # Exponential backoff
+        time.sleep(0.5 * 2 ** attempt)
+
+# Function to extract plastics, paper type and source type for each record using ChatGPT
+def extract_article_information(df, client, max_articles=100, max_retries=3):
+
+    # Retries are handled (and counted) by query_chatgpt, not by the client
+    client = client.with_options(max_retries=0)
+
+    # Ensure required columns exist
+    if not {"Title", "Abstract"}.issubset(df.columns):
+        raise ValueError("CSV must contain 'Title' and 'Abstract' columns")
+
+    results = []
+
+    # Step 2: Loop through each record
+    for _, row in df.head(max_articles).iterrows():
+
+        title = str(row["Title"])
+        abstract = str(row["Abstract"])
     
-    text = f"Title: {title}\nAbstract: {abstract}"
+        text = f"Title: {title}\nAbstract: {abstract}"
 
-    # Step 3: Prompt ChatGPT for plastics, paper type, and source type
-    prompt = f"""
+        # Step 3: Prompt ChatGPT for plastics, paper type, and source type
+        prompt = f"""
     You are an expert in environmental and materials science, specialized in analyzing research literature.
 
     Read the following research paper title and abstract, and identify three pieces of information:
@@ -56,52 +107,75 @@ for _, row in df.head(100).iterrows():
     {text}
     """
 
-    # Step 4: Query ChatGPT
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are a scientific text analysis assistant."},
-            {"role": "user", "content": prompt}
-        ]
-    )
-
-    # Step 5: Extract and parse response
-    content = response.choices[0].message.content.strip()
-
-    plastics_found, paper_type, source_type = "None", "Unknown", "Unknown"
-
-    try:
-        parsed = json.loads(content)
-        plastics_found = parsed.get("plastics_found", "None")
-        paper_type = parsed.get("paper_type", "Unknown")
-        source_type = parsed.get("source_type", "Unknown")
-    except Exception:
-        # fallback: simple keyword extraction if JSON parsing fails
-        if "Review" in content:
-            paper_type = "Review Paper"
-        elif "Primary" in content:
-            paper_type = "Primary Study"
-        for term in ["River", "Estuary", "Lake", "Bay", "Reservoir", "Mangrove", "WWTP", "Ocean", "Marine"]:
-            if term.lower() in content.lower():
-                source_type = term
-                break
-
-    print(f"Processing: {title}")
-    print(f"  → Plastics: {plastics_found}")
-    print(f"  → Paper Type: {paper_type}")
-    print(f"  → Source Type: {source_type}\n")
-
-    # Step 6: Append result
-    results.append({
-        "title": title,
-        "abstract": abstract,
-        "plastics_found": plastics_found,
-        "paper_type": paper_type,
-        "source_type": source_type
-    })
-
-# Step 7: Save output
-output_df = pd.DataFrame(results)
-output_df.to_csv("output_with_source_typexx.csv", index=False)
-
-print("✅ Done! Created 'output_with_source_type.csv' with plastics, paper type, and source type.")
+        # Step 4: Query ChatGPT
+        response = query_chatgpt(client, prompt, max_retries)
+
+        # Step 5: Extract and parse response
+        content = response.choices[0].message.content.strip()
+
+        plastics_found, paper_type, source_type = "None", "Unknown", "Unknown"
+
+        try:
+            parsed = json.loads(content)
+            plastics_found = parsed.get("plastics_found", "None")
+            paper_type = parsed.get("paper_type", "Unknown")
+            source_type = parsed.get("source_type", "Unknown")
+        except Exception:
+            # fallback: simple keyword extraction if JSON parsing fails
+            if "Review" in content:
+                paper_type = "Review Paper"
+            elif "Primary" in content:
+                paper_type = "Primary Study"
+            for term in ["River", "Estuary", "Lake", "Bay", "Reservoir", "Mangrove", "WWTP", "Ocean", "Marine"]:
+                if term.lower() in content.lower():
+                    source_type = term
+                    break
+
+        print(f"Processing: {title}")
+        print(f"  → Plastics: {plastics_found}")
+        print(f"  → Paper Type: {paper_type}")
+        print(f"  → Source Type: {source_type}\n")
+
+        # Step 6: Append result
+        results.append({
+            "title": title,
+            "abstract": abstract,
+            "plastics_found": plastics_found,
+            "paper_type": paper_type,
+            "source_type": source_type
+        })
+
+    return results
+
+# Function to run the extraction on a CSV file and save the results
+def run_extraction(input_csv, output_csv, client=None, max_articles=100):
+    # Initialize OpenAI client (reads the API key from the OPENAI_API_KEY environment variable)
+    if client is None:
+        client = OpenAI()
+
+    # Step 1: Read CSV file
+    df = pd.read_csv(input_csv)
+
+    with instrumentation.stage("extraction"):
+        results = extract_article_information(df, client, max_articles)
+        instrumentation.record_rows("extraction", rows_in=min(len(df), max_articles), rows_out=len(results))
+
+    # Step 7: Save output
+    output_df = pd.DataFrame(results)
+    output_df.to_csv(output_csv, index=False)
+
+    print(f"✅ Done! Created '{output_csv}' with plastics, paper type, and source type.")
+    return output_df
+
+# Input and output paths
+script_directory = os.path.dirname(os.path.abspath(__file__))
+input_csv_path = os.path.join(os.path.dirname(script_directory), "2-ASR_Input", "Compilation_Outputs", "unique_articles.csv")
+output_csv_path = os.path.join(script_directory, "output_with_source_type.csv")
+
+# Main function to orchestrate the script
+def main():
+    run_extraction(input_csv_path, output_csv_path)
+    instrumentation.write_report(os.path.join(script_directory, "extraction_run_report.json"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Synthetic corpora for benchmarking the compilation step (and the stages that read its output).
+
+"generate_compilation_inputs" builds the four source DataFrames (PubMed, WoS, GreenFILE,
+Embase) with the same column names as the real exports, so they can be passed straight to
+"compile_database_information". The share of each database, of duplicated DOIs and of
+articles without a DOI follow the proportions of our real run (see Compilation_Outputs/stats.txt).
+
+"""
+
+import random
+
+import pandas as pd
+
+# Named sizes used by the benchmark command line
+SIZES = {"10k": 10_000, "100k": 100_000, "1M": 1_000_000}
+
+# Share of each database in the compiled corpus (3639 / 1164 / 200 / 2261 in our real run)
+SOURCE_SHARES = {"pubmed": 0.50, "wos": 0.16, "greenfile": 0.03, "embase": 0.31}
+
+WORDS = ["microplastic", "antibiotic", "resistance", "gene", "biofilm", "plastisphere", "river", "sediment",
+         "wastewater", "polyethylene", "polystyrene", "bacteria", "abundance", "transfer", "horizontal",
+         "marine", "estuary", "integron", "sulfonamide", "tetracycline", "metagenomic", "community"]
+JOURNALS = ["Water Research", "Environmental Science & Technology", "Science of the Total Environment",
+            "Journal of Hazardous Materials", "Environmental Pollution", "Chemosphere"]
+SURNAMES = ["Zhang", "Wang", "Li", "Smith", "Müller", "Garcia", "Kumar", "Larsson", "Chen", "Nguyen"]
+
+
+# Function to create one synthetic article (deterministic for a given article number)
+def synthetic_article(number, no_doi_fraction):
+    rng = random.Random(number)
+    title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 14))).capitalize()
+    abstract = " ".join(rng.choice(WORDS) for _ in range(rng.randint(120, 250))).capitalize() + "."
+    authors = ", ".join(f"{rng.choice(SURNAMES)} {chr(65 + rng.randint(0, 25))}" for _ in range(rng.randint(1, 8)))
+    doi = None if rng.random() < no_doi_fraction else f"10.{1000 + number % 9000}/synthetic.{number}"
+    return title, abstract, authors, doi, rng.choice(JOURNALS)
+
+def generate_compilation_inputs(n_records, duplicate_fraction=0.30, no_doi_fraction=0.02, seed=0):
+    """
+    Generate PubMed, WoS, GreenFILE and Embase DataFrames with n_records rows in total.
+
+    "duplicate_fraction" of the rows repeat an article that already appears in another
+    database (as in our real run, where ~30% of the compiled rows were repeats).
+
+    """
+    rng = random.Random(seed)
+    n_unique = max(1, int(n_records * (1 - duplicate_fraction)))
+    article_numbers = list(range(n_unique)) + [rng.randrange(n_unique) for _ in range(n_records - n_unique)]
+    rng.shuffle(article_numbers)
+
+    rows = {source: [] for source in SOURCE_SHARES}
+    sources = list(SOURCE_SHARES)
+    weights = list(SOURCE_SHARES.values())
+    for number in article_numbers:
+        rows[rng.choices(sources, weights)[0]].append(synthetic_article(number, no_doi_fraction))
+
+    # Manual exports leave a missing DOI empty, while pubmed.py writes 'No DOI'
+    pubmed_df = pd.DataFrame(rows["pubmed"], columns=["Title", "Abstract", "Authors", "DOI", "Journal"])
+    pubmed_df["DOI"] = pubmed_df["DOI"].fillna("No DOI")
+    wos_df = pd.DataFrame(rows["wos"], columns=["Article Title", "Abstract", "Authors", "DOI", "Source Title"])
+    greenfile_df = pd.DataFrame(rows["greenfile"], columns=["title", "abstract", "contributors", "doi", "source"])
+    embase_df = pd.DataFrame(rows["embase"], columns=["Title", "Abstract", "Author Names", "DOI", "Source title"])
+    return pubmed_df, wos_df, greenfile_df, embase_df
+
+# Function to write a unique_articles.csv-style input for the BibTeX and extraction stages
+def write_unique_articles_csv(n_records, path, seed=0):
+    rows = [synthetic_article(seed * 10_000_000 + number, no_doi_fraction=0.0) for number in range(n_records)]
+    df = pd.DataFrame(rows, columns=["Title", "Abstract", "Authors", "DOI", "Journal"])
+    df.to_csv(path, index=False)
+    return path
@@ -0,0 +1,363 @@
+"""
+Local HTTP stand-ins for the external services used by the pipeline, so every stage can be
+benchmarked without network access:
+
+    /entrez/eutils/esearch.fcgi                       NCBI E-utilities search (PMIDs)
+    /entrez/eutils/efetch.fcgi                        NCBI E-utilities fetch (article XML)
+    /works/<doi>/transform/application/x-bibtex       CrossRef BibTeX
+    /v1/chat/completions                              OpenAI chat completions
+
+Responses are synthetic (generated deterministically from the PMID/DOI) unless a recorded
+response is found in the fixtures folder (see "record_fixture"). Latency, rate limiting and
+error injection are configurable.
+
+Run standalone:
+    python benchmarks/fake_services.py --port 8000 --latency 0.05 --rate-limit 10 --error-rate 0.01
+
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+# Vocabulary used to build synthetic records
+JOURNALS = ["Environmental Science & Technology", "Water Research", "Science of the Total Environment",
+            "Journal of Hazardous Materials", "Environmental Pollution", "Chemosphere"]
+PLASTICS = ["polyethylene", "polypropylene", "polystyrene", "polyvinyl chloride", "polyethylene terephthalate"]
+SOURCES = ["river", "estuary", "lake", "wastewater treatment plant", "marine sediment", "mangrove"]
+GENES = ["sul1", "sul2", "tetA", "tetC", "blaTEM", "intI1", "ermB", "qnrS"]
+SURNAMES = ["Zhang", "Wang", "Li", "Smith", "Müller", "Garcia", "Kumar", "Larsson", "Chen", "Nguyen"]
+FORENAMES = ["Wei", "Anna", "Jun", "Maria", "Lars", "Priya", "Tom", "Yuki", "Omar", "Lena"]
+
+
+class ServiceConfig:
+    """
+    Behaviour of the fake services.
+
+    latency      fixed delay (seconds) added to every response
+    jitter       extra random delay between 0 and "jitter" seconds
+    rate_limit   maximum requests per second (token bucket); excess requests get HTTP 429
+    error_rate   fraction of requests answered with HTTP 500/503
+    total_pmids  number of PMIDs the fake esearch returns for any query
+    fixtures_dir folder with recorded responses (served instead of synthetic ones if present)
+
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, rate_limit=None, error_rate=0.0, total_pmids=1000,
+                 fixtures_dir=None, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.total_pmids = total_pmids
+        self.fixtures_dir = fixtures_dir
+        self.seed = seed
+
+
+# Function to build the fixture file name (without extension) of a request
+def fixture_key(method, path, params, body=b""):
+    query = "&".join(f"{key}={value}" for key, value in sorted(params.items()))
+    digest = hashlib.sha1(f"{method} {path}?{query}".encode("utf-8"))
+    if body:
+        digest.update(b"\n")
+        digest.update(_canonical_body(body))
+    return digest.hexdigest()
+
+def _canonical_body(body):
+    # JSON bodies (e.g. chat completions) are keyed on their content, not on how a client serialised them
+    try:
+        return json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode("utf-8")
+    except ValueError:
+        return body
+
+def record_fixture(url, params, path, fixtures_dir, method="GET", body=None, headers=None):
+    """
+    Send a real request once and store its response as a fixture, e.g.
+    record_fixture("https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi",
+                   {"db": "pubmed", "id": "12345", "retmode": "xml"}, "/entrez/eutils/efetch.fcgi", "fixtures")
+    record_fixture("https://api.openai.com/v1/chat/completions", {}, "/v1/chat/completions", "fixtures",
+                   method="POST", body={"model": "gpt-4o-mini", "messages": [...]},
+                   headers={"Authorization": "Bearer <key>"})
+
+    "path" is the path under which the fake server will serve it. A dict "body" is sent as
+    JSON. The response body is saved as "<key>.body" and its Content-Type in "<key>.json".
+
+    A fixture is only replayed for a request with exactly the same parameters (and body), so
+    they must match what the stage sends. For PubMed that is, for esearch, {"db": "pubmed",
+    "term": <query, including the " AND (<start>[PDAT] : <end>[PDAT])" filter when dates are
+    given>, "retmax": 200, "retstart": 0, 200, 400, ..., "retmode": "xml", "sort": "relevance"},
+    one fixture per page including the last, empty one, and for efetch {"db": "pubmed", "id":
+    <the 200 comma-separated PMIDs of the batch>, "retmode": "xml"}. Then run the benchmark
+    with the same "--query", "--start-date" and "--end-date".
+
+    """
+    import requests
+
+    headers = dict(headers or {})
+    if isinstance(body, dict):
+        body = json.dumps(body).encode("utf-8")
+        headers.setdefault("Content-Type", "application/json")
+    body = body or b""
+
+    response = requests.request(method, url, params=params, data=body or None, headers=headers, timeout=60)
+    response.raise_for_status()
+
+    os.makedirs(fixtures_dir, exist_ok=True)
+    key = fixture_key(method, path, {key: str(value) for key, value in params.items()}, body)
+    fixture_path = os.path.join(fixtures_dir, key + ".body")
+    with open(fixture_path, "wb") as file:
+        file.write(response.content)
+    with open(os.path.join(fixtures_dir, key + ".json"), "w", encoding="utf-8") as file:
+        json.dump({"content_type": response.headers.get("Content-Type", "application/octet-stream")}, file)
+    return fixture_path
+
+def synthetic_article_xml(pmid):
+    """
+    Build one PubmedArticle element. Roughly one article in ten lacks optional fields
+    (DOI, volume, keywords, ...) so the "No ... available" paths of the parser are exercised.
+
+    """
+    rng = random.Random(pmid)
+    sparse = pmid % 10 == 0
+    plastic = rng.choice(PLASTICS)
+    source = rng.choice(SOURCES)
+    genes = rng.sample(GENES, 3)
+    title = f"Occurrence of {', '.join(genes)} on {plastic} microplastics in a {source} <i>in situ</i> study."
+    abstract = " ".join(
+        f"Microplastics made of {plastic} were collected from the {source} and the abundance of {gene} was quantified by qPCR."
+        for gene in genes
+    ) * 3
+    authors = "".join(
+        f"<Author><LastName>{rng.choice(SURNAMES)}</LastName><ForeName>{rng.choice(FORENAMES)}</ForeName></Author>"
+        for _ in range(rng.randint(2, 8))
+    )
+    keywords = "" if sparse else "<KeywordList>" + "".join(
+        f"<Keyword>{escape(keyword)}</Keyword>" for keyword in ["Microplastics", "Antibiotic resistance genes", plastic, source]
+    ) + "</KeywordList>"
+    mesh = "" if sparse else "<MeshHeadingList>" + "".join(
+        f"<MeshHeading><DescriptorName>{term}</DescriptorName></MeshHeading>"
+        for term in ["Microplastics", "Drug Resistance, Microbial", "Genes, Bacterial", "Water Pollutants, Chemical"]
+    ) + "</MeshHeadingList>"
+    doi = "" if sparse else f'<ELocationID EIdType="doi">10.{1000 + pmid % 9000}/synthetic.{pmid}</ELocationID>'
+    volume = "" if sparse else f"<Volume>{rng.randint(1, 900)}</Volume><Issue>{rng.randint(1, 24)}</Issue>"
+    pmc = "" if pmid % 3 else f'<ArticleId IdType="pmc">PMC{pmid + 1000000}</ArticleId>'
+    return (
+        "<PubmedArticle><MedlineCitation>"
+        f"<PMID>{pmid}</PMID>"
+        "<Article>"
+        f"<Journal><ISSN>{1000 + pmid % 8999}-{1000 + pmid % 7919}</ISSN><JournalIssue>{volume}"
+        f"<PubDate><Year>{2000 + pmid % 25}</Year><Month>Jan</Month><Day>{1 + pmid % 28}</Day></PubDate>"
+        f"</JournalIssue><Title>{escape(rng.choice(JOURNALS))}</Title></Journal>"
+        f"<ArticleTitle>{title}</ArticleTitle>"
+        f"<Pagination><MedlinePgn>{rng.randint(1, 500)}-{rng.randint(501, 999)}</MedlinePgn></Pagination>"
+        f"{doi}"
+        f"<Abstract><AbstractText>{escape(abstract)}</AbstractText></Abstract>"
+        f"<AuthorList>{authors}</AuthorList>"
+        "<Language>eng</Language>"
+        "<PublicationTypeList><PublicationType>Journal Article</PublicationType></PublicationTypeList>"
+        "</Article>"
+        f"{mesh}{keywords}"
+        "</MedlineCitation>"
+        f'<PubmedData><ArticleIdList><ArticleId IdType="pubmed">{pmid}</ArticleId>{pmc}</ArticleIdList></PubmedData>'
+        "</PubmedArticle>"
+    )
+
+def synthetic_bibtex(doi):
+    key = doi.split("/")[-1].replace(".", "_")
+    return (
+        f"@article{{{key},\n"
+        f"  title = {{Synthetic article {doi}}},\n"
+        f"  author = {{Zhang, Wei and Larsson, Lena}},\n"
+        f"  journal = {{Water Research}},\n"
+        f"  year = {{2024}},\n"
+        f"  doi = {{{doi}}}\n"
+        f"}}\n"
+    )
+
+def synthetic_chat_completion(prompt):
+    content = json.dumps({
+        "plastics_found": "PE, PP",
+        "paper_type": "Primary Study",
+        "source_type": "River",
+        "method_ar_detection": "qPCR",
+    })
+    prompt_tokens = max(1, len(prompt) // 4)
+    completion_tokens = max(1, len(content) // 4)
+    return {
+        "id": "chatcmpl-benchmark",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "gpt-4o-mini",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+class FakeServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # Keep benchmark output readable
+        pass
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def _handle(self, method):
+        server = self.server
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query))
+        body = b""
+        if method == "POST":
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        delay, status = server.admit()
+        if delay:
+            time.sleep(delay)
+        if status is not None:
+            self._send(status, b'{"error": "injected"}', "application/json")
+            return
+
+        fixture = server.find_fixture(method, url.path, params, body)
+        if fixture is not None:
+            self._send(200, *fixture)
+        elif url.path.endswith("/esearch.fcgi"):
+            self._send(200, server.esearch(params), "text/xml")
+        elif url.path.endswith("/efetch.fcgi"):
+            pmids = [int(pmid) for pmid in params.get("id", "").split(",") if pmid]
+            xml = "<?xml version=\"1.0\"?><PubmedArticleSet>" + "".join(synthetic_article_xml(pmid) for pmid in pmids) + "</PubmedArticleSet>"
+            self._send(200, xml.encode("utf-8"), "text/xml")
+        elif url.path.startswith("/works/") and url.path.endswith("/transform/application/x-bibtex"):
+            doi = unquote(url.path[len("/works/"):-len("/transform/application/x-bibtex")])
+            self._send(200, synthetic_bibtex(doi).encode("utf-8"), "application/x-bibtex")
+        elif url.path.endswith("/chat/completions") and method == "POST":
+            request = json.loads(body or b"{}")
+            prompt = " ".join(message.get("content", "") for message in request.get("messages", []))
+            self._send(200, json.dumps(synthetic_chat_completion(prompt)).encode("utf-8"), "application/json")
+        else:
+            self._send(404, b"Not found", "text/plain")
+
+    def _send(self, status, payload, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeServiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config):
+        super().__init__(address, FakeServiceHandler)
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.lock = threading.Lock()
+        # Token bucket for the rate limit. It holds at least one token, so rates below 1 request/s still admit requests
+        self.bucket_size = max(1, config.rate_limit) if config.rate_limit else 0
+        self.tokens = self.bucket_size
+        self.last_refill = time.monotonic()
+
+    def admit(self):
+        """
+        Decide the delay and (possibly injected) error status of one request.
+        Returns (delay_seconds, status_or_None).
+
+        """
+        config = self.config
+        with self.lock:
+            delay = config.latency + (self.rng.uniform(0, config.jitter) if config.jitter else 0)
+            if config.rate_limit:
+                now = time.monotonic()
+                self.tokens = min(self.bucket_size, self.tokens + (now - self.last_refill) * config.rate_limit)
+                self.last_refill = now
+                if self.tokens < 1:
+                    return delay, 429
+                self.tokens -= 1
+            if config.error_rate and self.rng.random() < config.error_rate:
+                return delay, self.rng.choice([500, 503])
+        return delay, None
+
+    def find_fixture(self, method, path, params, body=b""):
+        """
+        Returns (payload, content_type) of the recorded response for this request, or None.
+
+        """
+        if not self.config.fixtures_dir:
+            return None
+        key = fixture_key(method, path, params, body)
+        fixture_path = os.path.join(self.config.fixtures_dir, key + ".body")
+        if not os.path.exists(fixture_path):
+            return None
+        with open(fixture_path, "rb") as file:
+            payload = file.read()
+        content_type = "application/octet-stream"
+        metadata_path = os.path.join(self.config.fixtures_dir, key + ".json")
+        if os.path.exists(metadata_path):
+            with open(metadata_path, "r", encoding="utf-8") as file:
+                content_type = json.load(file).get("content_type", content_type)
+        return payload, content_type
+
+    def esearch(self, params):
+        retstart = int(params.get("retstart", 0))
+        retmax = int(params.get("retmax", 20))
+        stop = min(retstart + retmax, self.config.total_pmids)
+        ids = "".join(f"<Id>{10000000 + index}</Id>" for index in range(retstart, stop))
+        return (
+            f'<?xml version="1.0"?><eSearchResult><Count>{self.config.total_pmids}</Count>'
+            f"<RetMax>{max(0, stop - retstart)}</RetMax><RetStart>{retstart}</RetStart>"
+            f"<IdList>{ids}</IdList></eSearchResult>"
+        ).encode("utf-8")
+
+
+# Function to start the fake services in a background thread; returns the server (call "shutdown" when done)
+def start_server(config, host="127.0.0.1", port=0):
+    server = FakeServiceServer((host, port), config)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def serve_in_process(config, port_queue):
+    """
+    Entry point for running the fake services in a separate process (so the server does
+    not share the GIL or memory measurements with the stage being benchmarked).
+
+    """
+    server = FakeServiceServer(("127.0.0.1", 0), config)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve fake E-utilities, CrossRef and OpenAI endpoints.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=None)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--total-pmids", type=int, default=1000)
+    parser.add_argument("--fixtures")
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args()
+
+    config = ServiceConfig(options.latency, options.jitter, options.rate_limit, options.error_rate,
+                           options.total_pmids, options.fixtures, options.seed)
+    server = FakeServiceServer(("127.0.0.1", options.port), config)
+    print(f"Serving fake services on http://127.0.0.1:{options.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
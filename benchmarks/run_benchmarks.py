@@ -0,0 +1,317 @@
+"""
+Offline benchmarks for the four pipeline stages.
+
+Network stages run against the local stand-ins in "fake_services.py" (started in a separate
+process), the compilation step runs on synthetic corpora from "corpora.py". For every stage
+the throughput (records per second) and peak memory are reported, together with the
+instrumentation metrics of the stage (requests, latency histogram, tokens, ...). Throughput
+is timed in a run without tracing, and peak memory comes from a second run under tracemalloc. The
+"records" benchmark reports the memory per parsed PubMed article.
+
+Usage examples:
+    python benchmarks/run_benchmarks.py                                  # all stages, default sizes
+    python benchmarks/run_benchmarks.py --stages compilation --sizes 10k 100k 1M
+    python benchmarks/run_benchmarks.py --latency 0.05 --error-rate 0.01 --output new.json --baseline old.json
+
+With "--baseline", the run fails (exit code 1) if any throughput dropped or peak memory grew
+by more than "--tolerance" compared to the baseline results.
+
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Make the repository root (instrumentation, run_pipeline) importable
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+import instrumentation
+from run_pipeline import load_stage_module
+
+import corpora
+import fake_services
+
+STAGES = ["pubmed", "records", "compilation", "bibtex", "extraction"]
+
+
+@contextlib.contextmanager
+def fake_server(config):
+    """
+    Run the fake services in their own process and yield their base URL.
+
+    """
+    port_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=fake_services.serve_in_process, args=(config, port_queue), daemon=True)
+    process.start()
+    try:
+        port = port_queue.get(timeout=30)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        process.terminate()
+        process.join()
+
+# Function to run one benchmark and collect throughput, memory and stage metrics
+def measure(name, stage_name, function, options):
+    """
+    Run "function" (which returns the number of rows it processed) once without tracing to
+    time it, and then, unless disabled, a second time under tracemalloc for the peak memory.
+    tracemalloc slows Python code down several times, so it must not affect the throughput.
+
+    """
+    output = io.StringIO()
+
+    instrumentation.reset()
+    gc.collect()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stdout if options.verbose else output):
+        rows = function()
+    wall_time = time.perf_counter() - start
+    metrics = instrumentation.report()["stages"].get(stage_name)
+
+    peak_memory = None
+    if options.tracemalloc:
+        gc.collect()
+        tracemalloc.start()
+        with contextlib.redirect_stdout(sys.stdout if options.verbose else output):
+            function()
+        peak_memory = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+        tracemalloc.stop()
+        instrumentation.reset()
+
+    result = {
+        "benchmark": name,
+        "rows": rows,
+        "wall_time_s": round(wall_time, 3),
+        "throughput_rows_per_s": round(rows / wall_time, 1) if wall_time > 0 else None,
+        "peak_memory_mb": peak_memory,
+        "metrics": metrics,
+    }
+    print(f"{name:<38} {rows:>9} rows  {wall_time:>8.2f} s  {result['throughput_rows_per_s'] or 0:>10.1f} rows/s  "
+          f"peak {peak_memory if peak_memory is not None else '-':>8} MB")
+    return result
+
+def service_config(options, total_pmids=1000):
+    return fake_services.ServiceConfig(latency=options.latency, jitter=options.jitter, rate_limit=options.rate_limit,
+                                       error_rate=options.error_rate, total_pmids=total_pmids,
+                                       fixtures_dir=options.fixtures, seed=options.seed)
+
+def bench_pubmed(options, work_dir):
+    pubmed = load_stage_module("1-Article_Data/pubmed.py", "pubmed")
+    with fake_server(service_config(options, total_pmids=options.pubmed_articles)) as url:
+        pubmed.base_url = f"{url}/entrez/eutils/"
+
+        def run():
+            # With injected errors the fetch stops at the first failed request, which shows up as fewer rows
+            try:
+                articles = pubmed.fetch_all_pubmed_data(options.query, options.start_date, options.end_date)
+            except RuntimeError as error:
+                print(f"PubMed fetch failed: {error}")
+                return 0
+            pubmed.save_to_csv(articles, "pubmed.csv", work_dir)
+            return len(articles)
+
+        return [measure(f"fetch_all_pubmed_data[{options.pubmed_articles}]", "pubmed", run, options)]
+
+# Function to measure the memory kept alive by a list built by "build" (in bytes)
+def retained_memory(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    items = build()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return items, retained
+
+def legacy_article_dict(pubmed, record):
+    """
+    Rebuild the 17-key dict fetch_all_pubmed_data used to keep per article: a separate
+    string object per value, except for the "No ... available" placeholders (shared literals).
+
+    """
+    article = {}
+    for field, value in record.to_dict().items():
+        shared = value is pubmed.MISSING_VALUES.get(field) or value == ""
+        article[field] = value if shared else value.encode("utf-8").decode("utf-8")
+    return article
+
+def bench_records(options, work_dir):
+    """
+    Memory per parsed PubMed article: the compact ArticleRecord kept by fetch_all_pubmed_data
+    compared to the plain 17-key dict per article it replaced.
+
+    """
+    from lxml import etree
+
+    pubmed = load_stage_module("1-Article_Data/pubmed.py", "pubmed")
+    n_records = options.record_count
+    xml = "<PubmedArticleSet>" + "".join(fake_services.synthetic_article_xml(10000000 + index) for index in range(n_records)) + "</PubmedArticleSet>"
+    articles = etree.fromstring(xml.encode("utf-8")).findall(".//PubmedArticle")
+
+    records, record_bytes = retained_memory(lambda: [pubmed.parse_article(article) for article in articles])
+    # Title and abstract are stored the same way in both layouts, so also report the memory without them
+    text_bytes = sum(sys.getsizeof(record.title) + sys.getsizeof(record.abstract) for record in records)
+    del records
+    dicts, dict_bytes = retained_memory(lambda: [legacy_article_dict(pubmed, pubmed.parse_article(article)) for article in articles])
+    del dicts
+
+    results = []
+    for name, retained in (("ArticleRecord", record_bytes), ("dict", dict_bytes)):
+        result = {
+            "benchmark": f"records[{name}][{n_records}]",
+            "rows": n_records,
+            "retained_memory_mb": round(retained / (1024 * 1024), 1),
+            "bytes_per_record": round(retained / n_records),
+            "bytes_per_record_without_text": round((retained - text_bytes) / n_records),
+        }
+        print(f"{result['benchmark']:<38} {n_records:>9} rows  {result['bytes_per_record']:>8} bytes/record  "
+              f"({result['bytes_per_record_without_text']} without title/abstract)")
+        results.append(result)
+    print(f"{'':<38} dict / ArticleRecord memory: {dict_bytes / record_bytes:.1f}x "
+          f"({(dict_bytes - text_bytes) / (record_bytes - text_bytes):.1f}x without title/abstract)")
+    return results
+
+def bench_compilation(options, work_dir):
+    database_compilation = load_stage_module("2-ASR_Input/database_compilation.py", "database_compilation")
+    database_compilation.working_directory = work_dir
+    os.makedirs(os.path.join(work_dir, "2-ASR_Input", database_compilation.output_dir), exist_ok=True)
+
+    results = []
+    for size in options.sizes:
+        n_records = corpora.SIZES[size]
+        pubmed_df, wos_df, greenfile_df, embase_df = corpora.generate_compilation_inputs(n_records, seed=options.seed)
+        compiled = {}
+
+        def compile_step():
+            with instrumentation.stage("compilation"):
+                compiled["df"] = database_compilation.compile_database_information(pubmed_df, wos_df, greenfile_df, embase_df)[-1]
+            return len(compiled["df"])
+
+        def replicates_step():
+            with instrumentation.stage("compilation"):
+                database_compilation.process_replicates_and_dois(compiled["df"])
+            return len(compiled["df"])
+
+        results.append(measure(f"compile_database_information[{size}]", "compilation", compile_step, options))
+        results.append(measure(f"process_replicates_and_dois[{size}]", "compilation", replicates_step, options))
+        del pubmed_df, wos_df, greenfile_df, embase_df, compiled
+    return results
+
+def bench_bibtex(options, work_dir):
+    bibtex = load_stage_module("3-BibTex/bibtex.py", "bibtex")
+    input_csv = corpora.write_unique_articles_csv(options.bibtex_dois, os.path.join(work_dir, "bibtex_input.csv"), seed=options.seed)
+    with fake_server(service_config(options)) as url:
+        bibtex.crossref_url = f"{url}/works/"
+
+        def run():
+            bibtex.success_set.clear()
+            bibtex.failure_set.clear()
+            bibtex.process_bibtex_entries(input_csv, os.path.join(work_dir, "bibtex_files"),
+                                          os.path.join(work_dir, "failed_entries.csv"),
+                                          os.path.join(work_dir, "saved_entries.csv"),
+                                          os.path.join(work_dir, "bibtex_stats.txt"))
+            # Only saved entries count, so failed DOIs show up as lower throughput (attempts are in metrics.rows_in)
+            return len(bibtex.success_set)
+
+        return [measure(f"process_bibtex_entries[{options.bibtex_dois}]", "bibtex", run, options)]
+
+def bench_extraction(options, work_dir):
+    from openai import OpenAI
+
+    extraction = load_stage_module("4-Extraction_ChatGPT/extraction_chatgpt.py", "extraction_chatgpt")
+    input_csv = corpora.write_unique_articles_csv(options.extraction_articles, os.path.join(work_dir, "extraction_input.csv"), seed=options.seed)
+    with fake_server(service_config(options)) as url:
+        client = OpenAI(base_url=f"{url}/v1", api_key="benchmark")
+
+        def run():
+            output_df = extraction.run_extraction(input_csv, os.path.join(work_dir, "extraction_output.csv"),
+                                                  client=client, max_articles=options.extraction_articles)
+            return len(output_df)
+
+        return [measure(f"extraction[{options.extraction_articles}]", "extraction", run, options)]
+
+# Function to compare results with a baseline run and list the regressions
+def find_regressions(results, baseline, tolerance):
+    previous = {result["benchmark"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get(result["benchmark"])
+        if old is None:
+            continue
+        if old.get("throughput_rows_per_s") and result.get("throughput_rows_per_s") is not None \
+                and result["throughput_rows_per_s"] < old["throughput_rows_per_s"] * (1 - tolerance):
+            regressions.append(f"{result['benchmark']}: throughput {old['throughput_rows_per_s']} -> {result['throughput_rows_per_s']} rows/s")
+        if old.get("peak_memory_mb") and result.get("peak_memory_mb") is not None \
+                and result["peak_memory_mb"] > old["peak_memory_mb"] * (1 + tolerance):
+            regressions.append(f"{result['benchmark']}: peak memory {old['peak_memory_mb']} -> {result['peak_memory_mb']} MB")
+        if old.get("bytes_per_record") and result.get("bytes_per_record") is not None \
+                and result["bytes_per_record"] > old["bytes_per_record"] * (1 + tolerance):
+            regressions.append(f"{result['benchmark']}: memory per record {old['bytes_per_record']} -> {result['bytes_per_record']} bytes")
+    return regressions
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the pipeline stages.")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--sizes", nargs="+", choices=list(corpora.SIZES), default=["10k"],
+                        help="Synthetic corpus sizes for the compilation benchmark (default: 10k).")
+    parser.add_argument("--pubmed-articles", type=int, default=2000)
+    parser.add_argument("--query", default="benchmark query",
+                        help="PubMed query (must match the query of recorded E-utilities fixtures, if any).")
+    parser.add_argument("--start-date", help="PubMed publication start date (YYYY/MM/DD).")
+    parser.add_argument("--end-date", help="PubMed publication end date (YYYY/MM/DD).")
+    parser.add_argument("--record-count", type=int, default=20000, help="Articles parsed for the record memory benchmark.")
+    parser.add_argument("--bibtex-dois", type=int, default=500)
+    parser.add_argument("--extraction-articles", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="Fixed latency (seconds) of the fake services.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency (seconds) of the fake services.")
+    parser.add_argument("--rate-limit", type=float, default=None, help="Requests per second before the fake services answer 429.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500/503.")
+    parser.add_argument("--fixtures", help="Folder with recorded responses (see fake_services.record_fixture).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-tracemalloc", dest="tracemalloc", action="store_false",
+                        help="Skip the second, traced run used for peak memory (halves the benchmark time).")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the stages.")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Earlier results file to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (default: 0.2).")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    options = parse_arguments(argv)
+    benchmarks = {"pubmed": bench_pubmed, "records": bench_records, "compilation": bench_compilation,
+                  "bibtex": bench_bibtex, "extraction": bench_extraction}
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for stage_name in options.stages:
+            results.extend(benchmarks[stage_name](options, work_dir))
+
+    report = {
+        "settings": {key: value for key, value in vars(options).items() if key not in ("output", "baseline", "verbose")},
+        "results": results,
+    }
+    with open(options.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"Benchmark results saved to {options.output}")
+
+    if options.baseline:
+        with open(options.baseline, "r", encoding="utf-8") as file:
+            regressions = find_regressions(results, json.load(file), options.tolerance)
+        if regressions:
+            print("\nRegressions compared to baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("No regressions compared to baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
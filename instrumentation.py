@@ -0,0 +1,256 @@
+"""
+Shared instrumentation for the four pipeline stages (PubMed fetch, database compilation,
+BibTeX retrieval and ChatGPT extraction).
+
+Every stage wraps its work in "stage(name)" and reports outbound requests, retries, rows
+and LLM token usage against that stage name. At the end of a run "write_report()" dumps
+everything as a single JSON file so we can see where a run actually spends time and money.
+Set the PIPELINE_REPORT environment variable to a file path to save the report there instead
+of at the stage's own default location.
+
+Profiling is off by default. Set the PIPELINE_PROFILE environment variable to a folder
+(or call "enable_profiling") to get one cProfile ".prof" file per stage, covering every run
+of that stage since the start (or the last "reset"). cProfile only
+profiles the thread that enters the stage, so work done in worker threads is left out: for
+the BibTeX stage (fetching runs in a ThreadPoolExecutor) the profile mostly shows the main
+thread waiting in "as_completed". Use the request latency metrics for that stage instead.
+
+"""
+
+import cProfile
+import json
+import os
+import platform
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Upper bounds (in seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+# Default location of the JSON run report (relative to the current working directory)
+DEFAULT_REPORT_PATH = "run_report.json"
+
+# Lock guarding all metric updates, since BibTeX fetching records from worker threads
+_lock = threading.Lock()
+
+# Metrics of the current run, keyed by stage name
+_stages = {}
+# cProfile profilers of the current run, keyed by stage name
+_profiles = {}
+_run_started = datetime.now(timezone.utc)
+_profile_dir = os.environ.get("PIPELINE_PROFILE")
+
+
+class StageMetrics:
+    """
+    Counters collected for a single pipeline stage.
+
+    CPU time is measured with "time.process_time" and therefore covers every thread of the
+    process. When two stages run at the same time their CPU times overlap.
+
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.runs = 0
+        self.skipped = 0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.requests = 0
+        self.failed_requests = 0
+        self.status_codes = {}
+        self.retries = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.rows_in = 0
+        self.rows_out = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.total_tokens = 0
+        self.latency_total = 0.0
+        self.latency_min = None
+        self.latency_max = None
+        self.latency_histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add_latency(self, seconds):
+        self.latency_total += seconds
+        self.latency_min = seconds if self.latency_min is None else min(self.latency_min, seconds)
+        self.latency_max = seconds if self.latency_max is None else max(self.latency_max, seconds)
+        for index, upper_bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= upper_bound:
+                self.latency_histogram[index] += 1
+                return
+        self.latency_histogram[-1] += 1
+
+    def to_dict(self):
+        histogram = {f"le_{upper_bound}": count for upper_bound, count in zip(LATENCY_BUCKETS, self.latency_histogram)}
+        histogram["le_inf"] = self.latency_histogram[-1]
+        return {
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "wall_time_s": round(self.wall_time, 6),
+            "cpu_time_s": round(self.cpu_time, 6),
+            "requests": self.requests,
+            "failed_requests": self.failed_requests,
+            "status_codes": {str(code): count for code, count in sorted(self.status_codes.items(), key=lambda item: str(item[0]))},
+            "retries": self.retries,
+            "bytes_received": self.bytes_received,
+            "bytes_sent": self.bytes_sent,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "llm_tokens": {
+                "prompt": self.prompt_tokens,
+                "completion": self.completion_tokens,
+                "total": self.total_tokens,
+            },
+            "latency_s": {
+                "mean": round(self.latency_total / self.requests, 6) if self.requests else None,
+                "min": self.latency_min,
+                "max": self.latency_max,
+                "histogram": histogram,
+            },
+        }
+
+
+# Function to get (or create) the metrics of a stage
+def get_stage(name):
+    with _lock:
+        if name not in _stages:
+            _stages[name] = StageMetrics(name)
+        return _stages[name]
+
+# Function to switch on cProfile output for every stage
+def enable_profiling(output_dir):
+    global _profile_dir
+    _profile_dir = output_dir
+
+# Function to clear all collected metrics (mainly for benchmarks running several rounds)
+def reset():
+    global _run_started
+    with _lock:
+        _stages.clear()
+        _profiles.clear()
+        _run_started = datetime.now(timezone.utc)
+
+@contextmanager
+def stage(name):
+    """
+    Time a block of work as the stage "name" and yield its StageMetrics.
+    Runs of the same stage add up (metrics and profile), so a stage can be entered more than once.
+    When profiling is on, only the calling thread is profiled (not worker threads).
+
+    """
+    metrics = get_stage(name)
+    profiler = _start_profiler(name)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield metrics
+    finally:
+        wall_time = time.perf_counter() - wall_start
+        cpu_time = time.process_time() - cpu_start
+        with _lock:
+            metrics.runs += 1
+            metrics.wall_time += wall_time
+            metrics.cpu_time += cpu_time
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(_profile_dir, exist_ok=True)
+            profiler.dump_stats(os.path.join(_profile_dir, f"{name}.prof"))
+
+def _start_profiler(name):
+    if not _profile_dir:
+        return None
+    with _lock:
+        # One profiler per stage name, so the dumped file adds up all runs of the stage
+        profiler = _profiles.setdefault(name, cProfile.Profile())
+    try:
+        profiler.enable()
+    except ValueError:
+        # Only one profiler can be active at a time (e.g. when stages run concurrently)
+        print("Warning: another profiler is already active, not profiling this stage.")
+        return None
+    return profiler
+
+# Function to record one outbound request (HTTP or API call)
+def record_request(stage_name, seconds, status=None, bytes_received=0, bytes_sent=0, failed=False):
+    metrics = get_stage(stage_name)
+    with _lock:
+        metrics.requests += 1
+        metrics.add_latency(seconds)
+        metrics.status_codes[status] = metrics.status_codes.get(status, 0) + 1
+        metrics.bytes_received += bytes_received
+        metrics.bytes_sent += bytes_sent
+        if failed:
+            metrics.failed_requests += 1
+
+# Function to record that a stage was skipped because its inputs did not change
+def record_skip(stage_name):
+    metrics = get_stage(stage_name)
+    with _lock:
+        metrics.skipped += 1
+
+# Function to record a retried request
+def record_retry(stage_name, count=1):
+    metrics = get_stage(stage_name)
+    with _lock:
+        metrics.retries += count
+
+# Function to record rows read and/or written by a stage
+def record_rows(stage_name, rows_in=0, rows_out=0):
+    metrics = get_stage(stage_name)
+    with _lock:
+        metrics.rows_in += int(rows_in)
+        metrics.rows_out += int(rows_out)
+
+# Function to record LLM token usage from an OpenAI "usage" object
+def record_tokens(stage_name, usage):
+    if usage is None:
+        return
+    metrics = get_stage(stage_name)
+    with _lock:
+        metrics.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+        metrics.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+        metrics.total_tokens += getattr(usage, "total_tokens", 0) or 0
+
+def http_get(stage_name, url, **kwargs):
+    """
+    Drop-in replacement for "requests.get" that records latency, status and bytes
+    against the given stage. Exceptions (e.g. timeouts) are recorded as failed
+    requests and then re-raised.
+
+    """
+    import requests
+
+    start = time.perf_counter()
+    try:
+        response = requests.get(url, **kwargs)
+    except Exception as error:
+        record_request(stage_name, time.perf_counter() - start, status=type(error).__name__, failed=True)
+        raise
+    record_request(stage_name, time.perf_counter() - start, status=response.status_code,
+                   bytes_received=len(response.content), failed=response.status_code >= 400)
+    return response
+
+# Function to build the run report as a dictionary
+def report():
+    with _lock:
+        stages = {name: metrics.to_dict() for name, metrics in _stages.items()}
+    return {
+        "run_started": _run_started.isoformat(),
+        "run_finished": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "profile_dir": _profile_dir,
+        "stages": stages,
+    }
+
+# Function to save the run report as JSON (PIPELINE_REPORT, when set, takes priority over "path")
+def write_report(path=None):
+    path = os.environ.get("PIPELINE_REPORT") or path or DEFAULT_REPORT_PATH
+    with open(path, "w", encoding="utf-8") as report_file:
+        json.dump(report(), report_file, indent=2)
+    print(f"Run report saved to {path}")
+    return path
@@ -0,0 +1,311 @@
+"""
+Single entry point for the whole workflow:
+
+    PubMed fetch -> database compilation -> BibTeX retrieval
+                                         -> ChatGPT extraction
+
+Every stage declares the files it reads and writes. Before running a stage, a content hash
+of its inputs (plus its own script and parameters) is compared with the one stored after its
+last successful run in '.pipeline_state.json'. Stages whose inputs did not change (and whose
+outputs are still in place) are skipped, so a rerun only pays for what changed. A stage that
+fails, or that finishes with some items missing (e.g. DOIs whose BibTeX could not be
+fetched), is not recorded as up to date and runs again next time. Stages that do not depend
+on each other (BibTeX retrieval and ChatGPT extraction both only need the unique articles)
+run concurrently.
+
+Usage examples:
+    python run_pipeline.py                          # run everything that is out of date
+    python run_pipeline.py --dry-run                # only show what would run
+    python run_pipeline.py --force pubmed           # re-query PubMed even if query.txt is unchanged
+    python run_pipeline.py --stages bibtex extraction
+
+"""
+
+import argparse
+import glob
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+
+import instrumentation
+
+# Repository root (all stage paths are relative to it)
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# File storing the input fingerprints and output hashes of the last successful run of each stage
+STATE_FILE = os.path.join(ROOT, ".pipeline_state.json")
+
+# Lock guarding the state file, since stages can finish at the same time
+_state_lock = threading.Lock()
+
+
+class StageIncomplete(Exception):
+    """
+    Raised by a stage action that wrote its outputs but could not process every item.
+    The outputs are kept, but the stage is not recorded as up to date.
+
+    """
+
+
+class Stage:
+    """
+    One step of the pipeline.
+
+    "inputs" and "outputs" are paths relative to the repository root. Inputs may be glob
+    patterns (e.g. the WoS exports), outputs may be folders. "params" holds any setting
+    that changes the result of the stage without being a file (e.g. the date range).
+
+    """
+
+    def __init__(self, name, script, inputs, outputs, action, depends_on=(), params=None):
+        self.name = name
+        self.script = script
+        self.inputs = inputs
+        self.outputs = outputs
+        self.action = action
+        self.depends_on = list(depends_on)
+        self.params = params or {}
+
+
+# Function to import a stage script from its (non-package) folder
+def load_stage_module(script, module_name):
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(ROOT, script))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+# Stage actions: each one calls into the corresponding script
+def run_pubmed(options):
+    pubmed = load_stage_module("1-Article_Data/pubmed.py", "pubmed")
+    with open(os.path.join(ROOT, "1-Article_Data", "query.txt"), "r", encoding="utf-8") as file:
+        query = file.read().strip()
+    articles = pubmed.fetch_all_pubmed_data(query, options.start_date, options.end_date)
+    pubmed.save_to_csv(articles, "pubmed.csv", os.path.join(ROOT, "1-Article_Data", "Data"))
+
+def run_compilation(options):
+    database_compilation = load_stage_module("2-ASR_Input/database_compilation.py", "database_compilation")
+    database_compilation.compile_databases()
+
+def run_bibtex(options):
+    bibtex = load_stage_module("3-BibTex/bibtex.py", "bibtex")
+    bibtex.success_set.clear()
+    bibtex.failure_set.clear()
+    bibtex.process_bibtex_entries(bibtex.input_csv_path, bibtex.output_folder_path, bibtex.failed_csv_path,
+                                  bibtex.success_csv_path, bibtex.summary_txt_path)
+    if bibtex.failure_set:
+        raise StageIncomplete(f"{len(bibtex.failure_set)} DOIs failed (see 3-BibTex/failed_entries.csv)")
+
+def run_extraction(options):
+    extraction = load_stage_module("4-Extraction_ChatGPT/extraction_chatgpt.py", "extraction_chatgpt")
+    extraction.run_extraction(extraction.input_csv_path, extraction.output_csv_path, max_articles=options.max_articles)
+
+# Function to declare the pipeline as a dependency graph (in topological order)
+def build_stages(options):
+    unique_articles = "2-ASR_Input/Compilation_Outputs/unique_articles.csv"
+    return [
+        Stage("pubmed", "1-Article_Data/pubmed.py",
+              inputs=["1-Article_Data/query.txt"],
+              outputs=["1-Article_Data/Data/pubmed.csv"],
+              action=run_pubmed,
+              params={"start_date": options.start_date, "end_date": options.end_date}),
+        Stage("compilation", "2-ASR_Input/database_compilation.py",
+              inputs=["1-Article_Data/Data/pubmed.csv", "1-Article_Data/Data/wos*.xls",
+                      "1-Article_Data/Data/greenfile.csv", "1-Article_Data/Data/embase.csv"],
+              outputs=["2-ASR_Input/Compilation_Outputs/compiled_articles_from_all_databases.csv",
+                       unique_articles,
+                       "2-ASR_Input/Compilation_Outputs/repeated_articles.csv",
+                       "2-ASR_Input/Compilation_Outputs/stats.txt"],
+              action=run_compilation,
+              depends_on=["pubmed"]),
+        Stage("bibtex", "3-BibTex/bibtex.py",
+              inputs=[unique_articles],
+              outputs=["3-BibTex/bibtex_files", "3-BibTex/failed_entries.csv",
+                       "3-BibTex/saved_entries.csv", "3-BibTex/bibtex_stats.txt"],
+              action=run_bibtex,
+              depends_on=["compilation"]),
+        Stage("extraction", "4-Extraction_ChatGPT/extraction_chatgpt.py",
+              inputs=[unique_articles],
+              outputs=["4-Extraction_ChatGPT/output_with_source_type.csv"],
+              action=run_extraction,
+              depends_on=["compilation"],
+              params={"max_articles": options.max_articles}),
+    ]
+
+# Function to add the content of a file or folder to a hash
+def hash_path(path, digest):
+    if os.path.isdir(path):
+        for folder, subfolders, files in os.walk(path):
+            subfolders.sort()
+            for file in sorted(files):
+                file_path = os.path.join(folder, file)
+                digest.update(os.path.relpath(file_path, path).encode("utf-8"))
+                hash_path(file_path, digest)
+    elif os.path.isfile(path):
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+    else:
+        digest.update(b"<missing>")
+
+# Function to hash everything a stage depends on: its script, parameters and input files
+def stage_fingerprint(stage):
+    digest = hashlib.sha256()
+    digest.update(stage.name.encode("utf-8"))
+    hash_path(os.path.join(ROOT, stage.script), digest)
+    digest.update(json.dumps(stage.params, sort_keys=True).encode("utf-8"))
+    for pattern in stage.inputs:
+        matches = sorted(glob.glob(os.path.join(ROOT, pattern)))
+        if not matches:
+            digest.update(f"<missing {pattern}>".encode("utf-8"))
+        for path in matches:
+            digest.update(os.path.relpath(path, ROOT).encode("utf-8"))
+            hash_path(path, digest)
+    return digest.hexdigest()
+
+# Function to hash the current outputs of a stage (None for missing outputs)
+def output_hashes(stage):
+    hashes = {}
+    for output in stage.outputs:
+        path = os.path.join(ROOT, output)
+        if not os.path.exists(path):
+            hashes[output] = None
+            continue
+        digest = hashlib.sha256()
+        hash_path(path, digest)
+        hashes[output] = digest.hexdigest()
+    return hashes
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+    with open(STATE_FILE, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+def save_state(state):
+    with open(STATE_FILE, "w", encoding="utf-8") as file:
+        json.dump(state, file, indent=2, sort_keys=True)
+
+# Function to check whether a stage can be skipped
+def is_up_to_date(stage, fingerprint, state):
+    """
+    A stage is up to date when its inputs hash to the same fingerprint as after its last
+    successful run, and its outputs are all still there and unchanged since then.
+
+    """
+    previous = state.get(stage.name)
+    if previous is None or previous.get("fingerprint") != fingerprint:
+        return False
+    current_outputs = output_hashes(stage)
+    if any(value is None for value in current_outputs.values()):
+        return False
+    return previous.get("outputs") == current_outputs
+
+# Function to run (or skip) a single stage
+def execute_stage(stage, state, options, upstream_pending=False):
+    fingerprint = stage_fingerprint(stage)
+    if stage.name not in options.force and not upstream_pending and is_up_to_date(stage, fingerprint, state):
+        print(f"[{stage.name}] Inputs unchanged, skipping.")
+        instrumentation.record_skip(stage.name)
+        return "skipped"
+
+    if options.dry_run:
+        print(f"[{stage.name}] Would run.")
+        return "would run"
+
+    print(f"[{stage.name}] Running...")
+    try:
+        stage.action(options)
+    except StageIncomplete as error:
+        print(f"[{stage.name}] Incomplete: {error}. It will run again next time.")
+        with _state_lock:
+            if state.pop(stage.name, None) is not None:
+                save_state(state)
+        return "incomplete"
+
+    with _state_lock:
+        state[stage.name] = {
+            "fingerprint": fingerprint,
+            "outputs": output_hashes(stage),
+            "finished": datetime.now(timezone.utc).isoformat(),
+        }
+        save_state(state)
+    print(f"[{stage.name}] Done.")
+    return "ran"
+
+# Function to run the stages in dependency order, running independent stages concurrently
+def run_pipeline(stages, options):
+    state = load_state()
+    selected = {stage.name for stage in stages}
+    pending = {stage.name: stage for stage in stages}
+    outcomes = {}
+
+    with ThreadPoolExecutor(max_workers=options.workers) as executor:
+        running = {}
+        while pending or running:
+            for name, stage in list(pending.items()):
+                # Dependencies outside the selected stages are taken as they are on disk
+                dependencies = [dependency for dependency in stage.depends_on if dependency in selected]
+                if any(outcomes.get(dependency) in ("failed", "blocked") for dependency in dependencies):
+                    print(f"[{name}] Not run because an upstream stage failed.")
+                    outcomes[name] = "blocked"
+                    del pending[name]
+                elif all(dependency in outcomes for dependency in dependencies):
+                    # In a dry run, upstream stages did not actually refresh their outputs
+                    upstream_pending = any(outcomes[dependency] == "would run" for dependency in dependencies)
+                    running[executor.submit(execute_stage, stage, state, options, upstream_pending)] = name
+                    del pending[name]
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    outcomes[name] = future.result()
+                except Exception as error:
+                    print(f"[{name}] Failed: {error}")
+                    outcomes[name] = "failed"
+
+    return outcomes
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Run the literature pipeline, skipping stages whose inputs did not change.")
+    stage_names = ["pubmed", "compilation", "bibtex", "extraction"]
+    parser.add_argument("--stages", nargs="+", choices=stage_names, default=stage_names,
+                        help="Stages to consider (default: all). Unselected upstream stages are not run.")
+    parser.add_argument("--force", nargs="+", choices=stage_names, default=[],
+                        help="Stages to run even if their inputs did not change (e.g. to refresh PubMed results).")
+    parser.add_argument("--start-date", help="PubMed publication start date (YYYY/MM/DD).")
+    parser.add_argument("--end-date", help="PubMed publication end date (YYYY/MM/DD).")
+    parser.add_argument("--max-articles", type=int, default=100, help="Number of articles sent to ChatGPT (default: 100).")
+    parser.add_argument("--workers", type=int, default=2, help="Number of stages that may run at the same time (default: 2).")
+    parser.add_argument("--dry-run", action="store_true", help="Only show which stages would run.")
+    parser.add_argument("--report", default=os.path.join(ROOT, "run_report.json"), help="Path of the JSON run report (the PIPELINE_REPORT environment variable takes priority).")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    options = parse_arguments(argv)
+    stages = [stage for stage in build_stages(options) if stage.name in options.stages]
+
+    outcomes = run_pipeline(stages, options)
+
+    print("\nPipeline Summary:")
+    for stage in stages:
+        print(f"{stage.name}: {outcomes.get(stage.name, 'not run')}")
+
+    if not options.dry_run:
+        instrumentation.write_report(options.report)
+
+    return 1 if any(outcome in ("failed", "blocked", "incomplete") for outcome in outcomes.values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())